@@ -3,85 +3,190 @@
 # Run with: streamlit run app.py
 # ==========================
 import streamlit as st
+import pandas as pd
 import sqlite3
 import json
+import orjson
 import hashlib
-import datetime
-from typing import List, Dict, Any, Optional
+import hmac
+import secrets
+import threading
+import csv
+import io
+from typing import List, Dict, Any, Optional, Tuple
 
 DB_PATH = 'app.db'
+# UTC ISO-8601 timestamp computed by SQLite (column defaults and writes)
+SQL_NOW = "strftime('%Y-%m-%dT%H:%M:%fZ', 'now')"
+# Stay under SQLITE_MAX_VARIABLE_NUMBER (999 on older builds) for IN (...) lists
+SQL_MAX_VARS = 900
+# Entries in sqlite3's per-connection prepared-statement cache (default 128)
+SQL_CACHED_STATEMENTS = 256
+# Rows per page in the teacher submission log
+LOGS_PAGE_SIZE = 50
+# Required header of the Mass Import CSV
+IMPORT_COLUMNS = ('id', 'content', 'answer_type', 'answer')
+
+# Hot-path statements: one shared text each, so the statement cache always hits
+SQL_GET_USER_BY_EMAIL = 'SELECT id, role, name, email, password_hash, salt FROM users WHERE email = ?'
+SQL_GET_PROBLEM = 'SELECT id, content, answer_type, answer_json, answer_key_json, updated_at FROM problems WHERE id = ?'
+SQL_GET_PROBLEMS_IN = 'SELECT id, content, answer_type, answer_json, answer_key_json, updated_at FROM problems WHERE id IN ({})'
+SQL_UPSERT_PROBLEM = f'''INSERT OR REPLACE INTO problems(id, content, answer_type, answer_json, answer_key_json, created_by, updated_at)
+                         VALUES(?, ?, ?, ?, ?, COALESCE((SELECT created_by FROM problems WHERE id = ?), ?), {SQL_NOW})'''
+SQL_GET_PAPER = 'SELECT id, title, problem_ids_json, mode, show_problem_ids, created_by, created_at FROM papers WHERE id = ?'
+SQL_INS_PAPER = f'INSERT INTO papers(title, problem_ids_json, mode, show_problem_ids, created_by, created_at) VALUES(?,?,?,?,?,{SQL_NOW})'
+SQL_INS_SUBMISSION = f'INSERT INTO submissions(paper_id, pupil_id, answers_json, score, attempt_no, submitted_at) VALUES(?,?,?,?,?,{SQL_NOW})'
+SQL_COUNT_ATTEMPTS = 'SELECT COUNT(*) FROM submissions WHERE paper_id=? AND pupil_id=?'
+SQL_TEACHER_LOGS = '''SELECT s.id, s.paper_id, u.name, u.email, s.score, s.attempt_no, s.submitted_at
+                      FROM submissions s JOIN users u ON s.pupil_id = u.id
+                      ORDER BY s.submitted_at DESC LIMIT ? OFFSET ?'''
+SQL_COUNT_SUBMISSIONS = 'SELECT COUNT(*) FROM submissions'
+SQL_PUPIL_ATTEMPTS = '''SELECT s.submitted_at, p.id AS paper_id, p.title, p.mode, s.score, s.attempt_no
+                        FROM submissions s JOIN papers p ON s.paper_id = p.id
+                        WHERE s.pupil_id = ?
+                        ORDER BY s.submitted_at DESC'''
+SQL_ATTEMPTS_BY_PAPER = 'SELECT paper_id, COUNT(*) AS n FROM submissions WHERE pupil_id = ? GROUP BY paper_id'
 
 # ---------------
 # Utilities
 # ---------------
 
+# orjson for storage round-trips; stdlib json only for pretty display
+_loads = orjson.loads
+
+
+def _dumps(obj) -> str:
+    return orjson.dumps(obj).decode('utf-8')
+
+
 def set_page(new_page: str):
     st.session_state.page = new_page
 
 
+# journal_mode persists in the DB file; the rest are per-connection
+PRAGMAS = (
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA temp_store=MEMORY',
+    'PRAGMA cache_size=-64000',
+    'PRAGMA mmap_size=268435456',
+    'PRAGMA foreign_keys=ON',
+)
+
+
+@st.cache_resource
 def get_conn():
-    return sqlite3.connect(DB_PATH, check_same_thread=False)
+    # One long-lived connection shared across reruns and sessions
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False, isolation_level=None,
+                           cached_statements=SQL_CACHED_STATEMENTS)
+    conn.row_factory = sqlite3.Row
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+@st.cache_resource
+def get_write_lock():
+    # Serializes writers on the shared connection (check_same_thread=False)
+    return threading.Lock()
 
 
 def init_db():
     conn = get_conn()
-    c = conn.cursor()
-
-    # Users: minimal auth (teacher / pupil)
-    c.execute(
-        '''CREATE TABLE IF NOT EXISTS users (
-               id INTEGER PRIMARY KEY AUTOINCREMENT,
-               role TEXT NOT NULL CHECK(role IN ("teacher","pupil")),
-               name TEXT NOT NULL,
-               email TEXT UNIQUE NOT NULL,
-               password_hash TEXT NOT NULL
-           );'''
-    )
-
-    # Problems
-    c.execute(
-        '''CREATE TABLE IF NOT EXISTS problems (
-               id TEXT PRIMARY KEY,                -- e.g. "MATH101"
-               content TEXT NOT NULL,             -- HTML/Markdown allowed
-               answer_type TEXT NOT NULL CHECK(answer_type IN ("single","table")),
-               answer_json TEXT NOT NULL,         -- JSON: string or [[...]]
-               created_by INTEGER,
-               updated_at TEXT
-           );'''
-    )
-
-    # Papers (collections of problem ids)
-    c.execute(
-        '''CREATE TABLE IF NOT EXISTS papers (
-               id INTEGER PRIMARY KEY AUTOINCREMENT,
-               title TEXT NOT NULL,
-               problem_ids_json TEXT NOT NULL,    -- JSON array of strings
-               mode TEXT NOT NULL CHECK(mode IN ("training","test1","test2")),
-               show_problem_ids INTEGER NOT NULL CHECK(show_problem_ids IN (0,1)),
-               created_by INTEGER,
-               created_at TEXT
-           );'''
-    )
-
-    # Submissions (per paper & pupil & attempt)
-    c.execute(
-        '''CREATE TABLE IF NOT EXISTS submissions (
-               id INTEGER PRIMARY KEY AUTOINCREMENT,
-               paper_id INTEGER NOT NULL,
-               pupil_id INTEGER NOT NULL,
-               answers_json TEXT NOT NULL,              -- {problem_id: answer or [[...]]}
-               score REAL NOT NULL,                     -- percentage 0..100
-               attempt_no INTEGER NOT NULL,
-               submitted_at TEXT
-           );'''
-    )
-
-    conn.commit()
-    conn.close()
-
-
-def hash_pw(pw: str) -> str:
-    return hashlib.sha256(pw.encode('utf-8')).hexdigest()
+    with get_write_lock():
+        c = conn.cursor()
+        # Users: minimal auth (teacher / pupil)
+        c.execute(
+            '''CREATE TABLE IF NOT EXISTS users (
+                   id INTEGER PRIMARY KEY AUTOINCREMENT,
+                   role TEXT NOT NULL CHECK(role IN ("teacher","pupil")),
+                   name TEXT NOT NULL,
+                   email TEXT UNIQUE NOT NULL,
+                   password_hash TEXT NOT NULL,
+                   salt TEXT                          -- hex; NULL = legacy unsalted sha256
+               );'''
+        )
+        # Migrate databases created before per-user salts
+        if 'salt' not in [r['name'] for r in c.execute('PRAGMA table_info(users)').fetchall()]:
+            c.execute('ALTER TABLE users ADD COLUMN salt TEXT')
+
+        # Problems
+        c.execute(
+            '''CREATE TABLE IF NOT EXISTS problems (
+                   id TEXT PRIMARY KEY,                -- e.g. "MATH101"
+                   content TEXT NOT NULL,             -- HTML/Markdown allowed
+                   answer_type TEXT NOT NULL CHECK(answer_type IN ("single","table")),
+                   answer_json TEXT NOT NULL,         -- JSON: string or [[...]], as authored
+                   answer_key_json TEXT,              -- JSON: answer_json normalized for checking
+                   created_by INTEGER,
+                   updated_at TEXT DEFAULT (''' + SQL_NOW + ''')
+               );'''
+        )
+
+        # Papers (collections of problem ids)
+        c.execute(
+            '''CREATE TABLE IF NOT EXISTS papers (
+                   id INTEGER PRIMARY KEY AUTOINCREMENT,
+                   title TEXT NOT NULL,
+                   problem_ids_json TEXT NOT NULL,    -- JSON array of strings
+                   mode TEXT NOT NULL CHECK(mode IN ("training","test1","test2")),
+                   show_problem_ids INTEGER NOT NULL CHECK(show_problem_ids IN (0,1)),
+                   created_by INTEGER,
+                   created_at TEXT DEFAULT (''' + SQL_NOW + ''')
+               );'''
+        )
+
+        # Submissions (per paper & pupil & attempt)
+        c.execute(
+            '''CREATE TABLE IF NOT EXISTS submissions (
+                   id INTEGER PRIMARY KEY AUTOINCREMENT,
+                   paper_id INTEGER NOT NULL,
+                   pupil_id INTEGER NOT NULL,
+                   answers_json TEXT NOT NULL,              -- {problem_id: answer or [[...]]}
+                   score REAL NOT NULL,                     -- percentage 0..100
+                   attempt_no INTEGER NOT NULL,
+                   submitted_at TEXT DEFAULT (''' + SQL_NOW + ''')
+               );'''
+        )
+        # pupil_id first: also serves the per-pupil GROUP BY paper_id / history lookups
+        c.execute('CREATE INDEX IF NOT EXISTS ix_sub_pupil_paper ON submissions(pupil_id, paper_id);')
+        c.execute('CREATE INDEX IF NOT EXISTS ix_sub_submitted_at ON submissions(submitted_at DESC);')
+
+        # Migrate databases created before answer keys; authored answers stay untouched
+        if 'answer_key_json' not in [r['name'] for r in c.execute('PRAGMA table_info(problems)').fetchall()]:
+            c.execute('ALTER TABLE problems ADD COLUMN answer_key_json TEXT')
+        rows = c.execute('SELECT id, answer_type, answer_json FROM problems WHERE answer_key_json IS NULL').fetchall()
+        if rows:
+            c.execute('BEGIN')
+            try:
+                c.executemany('UPDATE problems SET answer_key_json = ? WHERE id = ?',
+                              [(_dumps(_normalize_answer(t, _loads(a))), pid) for pid, t, a in rows])
+            except Exception:
+                c.execute('ROLLBACK')
+                raise
+            c.execute('COMMIT')
+
+
+# Fixed salt for the throwaway KDF run that keeps failed lookups as slow as real checks
+_DUMMY_SALT = '00' * 16
+
+
+def new_salt() -> str:
+    return secrets.token_hex(16)
+
+
+def hash_pw(pw: str, salt: str) -> str:
+    return hashlib.scrypt(pw.encode('utf-8'), salt=bytes.fromhex(salt), n=2**14, r=8, p=1, dklen=32).hex()
+
+
+def verify_pw(pw: str, pw_hash: str, salt: Optional[str]) -> bool:
+    if salt is None:
+        # Legacy row (unsalted sha256), upgraded on next successful sign-in
+        hash_pw(pw, _DUMMY_SALT)
+        candidate = hashlib.sha256(pw.encode('utf-8')).hexdigest()
+    else:
+        candidate = hash_pw(pw, salt)
+    return hmac.compare_digest(candidate, pw_hash)
 
 
 # ---------------
@@ -95,15 +200,23 @@ def ensure_demo_users():
     # check if any user exists
     c.execute('SELECT COUNT(*) FROM users')
     (cnt,) = c.fetchone()
-    if cnt == 0:
-        users = [
-            ("teacher", "Teacher One", "teacher", hash_pw("1")),
-            ("pupil", "Pupil Alice", "alice", hash_pw("1")),
-            ("pupil", "Pupil Bob", "bob", hash_pw("1")),
-        ]
-        c.executemany('INSERT INTO users(role,name,email,password_hash) VALUES (?,?,?,?)', users)
-        conn.commit()
-    conn.close()
+    if cnt != 0:
+        return
+    # Hash outside the write lock: scrypt is slow and would stall every other writer
+    users = []
+    for role, name, email in [
+        ("teacher", "Teacher One", "teacher"),
+        ("pupil", "Pupil Alice", "alice"),
+        ("pupil", "Pupil Bob", "bob"),
+    ]:
+        salt = new_salt()
+        users.append((role, name, email, hash_pw("1", salt), salt))
+    with get_write_lock():
+        # Re-check under the lock in case another session seeded meanwhile
+        c.execute('SELECT COUNT(*) FROM users')
+        (cnt,) = c.fetchone()
+        if cnt == 0:
+            c.executemany('INSERT INTO users(role,name,email,password_hash,salt) VALUES (?,?,?,?,?)', users)
 
 
 # def login_form():
@@ -114,12 +227,11 @@ def ensure_demo_users():
 #     if st.sidebar.button("Sign in"):
 #         conn = get_conn()
 #         c = conn.cursor()
-#         c.execute('SELECT id, role, name, email, password_hash FROM users WHERE email = ?', (email,))
+#         c.execute(SQL_GET_USER_BY_EMAIL, (email,))
 #         row = c.fetchone()
-#         conn.close()
-#         if row and row[4] == hash_pw(pw):
-#             st.session_state.user = {"id": row[0], "role": row[1], "name": row[2], "email": row[3]}
-#             st.success(f"Signed in as {row[2]} ({row[1]})")
+#         if row and verify_pw(pw, row['password_hash'], row['salt']):
+#             st.session_state.user = {"id": row['id'], "role": row['role'], "name": row['name'], "email": row['email']}
+#             st.success(f"Signed in as {row['name']} ({row['role']})")
 #         else:
 #             st.error("Invalid credentials")
 
@@ -127,14 +239,22 @@ def login_form_main():
     st.subheader("Sign in")
     email = st.text_input("Email", key="login_email_main")
     pw = st.text_input("Password", type="password", key="login_pw_main")
+    # The KDF only runs on the click rerun, never while the inputs are being typed into
     if st.button("Sign in", key="signin_main"):
         conn = get_conn()
         c = conn.cursor()
-        c.execute('SELECT id, role, name, email, password_hash FROM users WHERE email = ?', (email,))
+        c.execute(SQL_GET_USER_BY_EMAIL, (email,))
         row = c.fetchone()
-        conn.close()
-        if row and row[4] == hash_pw(pw):
-            st.session_state.user = {"id": row[0], "role": row[1], "name": row[2], "email": row[3]}
+        if row is None:
+            # Unknown email: pay the same KDF cost so timing doesn't reveal which accounts exist
+            hash_pw(pw, _DUMMY_SALT)
+        if row and verify_pw(pw, row['password_hash'], row['salt']):
+            if row['salt'] is None:
+                salt = new_salt()
+                new_hash = hash_pw(pw, salt)  # outside the lock, see ensure_demo_users
+                with get_write_lock():
+                    c.execute('UPDATE users SET password_hash = ?, salt = ? WHERE id = ?', (new_hash, salt, row['id']))
+            st.session_state.user = {"id": row['id'], "role": row['role'], "name": row['name'], "email": row['email']}
             set_page("Home")
             st.rerun()
         else:
@@ -155,57 +275,116 @@ def require_auth(role: str = None) -> Optional[Dict[str, Any]]:
 # Problem helpers
 # ---------------
 
-def get_problem(pid: str) -> Optional[Dict[str, Any]]:
+def _get_problem_row(pid: str):
     conn = get_conn()
     c = conn.cursor()
-    c.execute('SELECT id, content, answer_type, answer_json, updated_at FROM problems WHERE id = ?', (pid,))
-    row = c.fetchone()
-    conn.close()
+    c.execute(SQL_GET_PROBLEM, (pid,))
+    return c.fetchone()
+
+
+@st.cache_data(ttl=60)
+def get_problem(pid: str) -> Optional[Dict[str, Any]]:
+    row = _get_problem_row(pid)
     if not row:
         return None
+    return _problem_from_row(row)
+
+
+def _problem_from_row(row) -> Dict[str, Any]:
     return {
-        'id': row[0], 'content': row[1], 'answer_type': row[2],
-        'answer': json.loads(row[3]), 'updated_at': row[4]
+        'id': row['id'], 'content': row['content'], 'answer_type': row['answer_type'],
+        'answer': _loads(row['answer_json']), 'answer_key': _loads(row['answer_key_json']),
+        'updated_at': row['updated_at']
     }
 
 
-def save_problem(pid: str, content_html_md: str, answer_type: str, answer):
-    now = datetime.datetime.utcnow().isoformat()
+def get_problems(pids: List[str]) -> Dict[str, Dict[str, Any]]:
+    """Batch version of get_problem: {problem_id: problem} for the ids that exist."""
+    if not pids:
+        return {}
+    # Hashable, order-independent cache key
+    return _get_problems(tuple(sorted(set(pids))))
+
+
+@st.cache_data(ttl=60)
+def _get_problems(pids: tuple) -> Dict[str, Dict[str, Any]]:
+    res = {}
     conn = get_conn()
     c = conn.cursor()
-    c.execute('INSERT OR REPLACE INTO problems(id, content, answer_type, answer_json, created_by, updated_at)\
-               VALUES(?, ?, ?, ?, COALESCE((SELECT created_by FROM problems WHERE id = ?), ?), ?)',
-              (pid, content_html_md, answer_type, json.dumps(answer), pid, st.session_state.user['id'], now))
-    conn.commit()
-    conn.close()
+    uniq = list(pids)
+    for i in range(0, len(uniq), SQL_MAX_VARS):
+        chunk = uniq[i:i + SQL_MAX_VARS]
+        placeholders = ','.join('?' * len(chunk))
+        c.execute(SQL_GET_PROBLEMS_IN.format(placeholders), chunk)
+        for row in c.fetchall():
+            res[row['id']] = _problem_from_row(row)
+    return res
+
+
+def save_problem(pid: str, content_html_md: str, answer_type: str, answer):
+    conn = get_conn()
+    with get_write_lock():
+        c = conn.cursor()
+        c.execute(SQL_UPSERT_PROBLEM,
+                  (pid, content_html_md, answer_type, _dumps(answer), _dumps(_normalize_answer(answer_type, answer)),
+                   pid, st.session_state.user['id']))
+    get_problem.clear()
+    _get_problems.clear()
+
+
+def save_problems_bulk(rows: List[Tuple[str, str, str, Any]]) -> int:
+    """Upsert many (id, content, answer_type, answer) rows in a single transaction."""
+    if not rows:
+        return 0
+    uid = st.session_state.user['id']
+    params = [(pid, content, answer_type, _dumps(answer), _dumps(_normalize_answer(answer_type, answer)), pid, uid)
+              for pid, content, answer_type, answer in rows]
+    conn = get_conn()
+    with get_write_lock():
+        c = conn.cursor()
+        c.execute('BEGIN')
+        try:
+            c.executemany(SQL_UPSERT_PROBLEM, params)
+        except Exception:
+            c.execute('ROLLBACK')
+            raise
+        c.execute('COMMIT')
+    get_problem.clear()
+    _get_problems.clear()
+    return len(params)
 
 
 # ---------------
 # Paper helpers
 # ---------------
 
-def get_paper(paper_id: int) -> Optional[Dict[str, Any]]:
+def _get_paper_row(paper_id: int):
     conn = get_conn()
     c = conn.cursor()
-    c.execute('SELECT id, title, problem_ids_json, mode, show_problem_ids, created_by, created_at FROM papers WHERE id = ?', (paper_id,))
-    row = c.fetchone()
-    conn.close()
+    c.execute(SQL_GET_PAPER, (paper_id,))
+    return c.fetchone()
+
+
+@st.cache_data(ttl=60)
+def get_paper(paper_id: int) -> Optional[Dict[str, Any]]:
+    row = _get_paper_row(paper_id)
     if not row:
         return None
     return {
-        'id': row[0], 'title': row[1], 'problem_ids': json.loads(row[2]), 'mode': row[3],
-        'show_problem_ids': bool(row[4]), 'created_by': row[5], 'created_at': row[6]
+        'id': row['id'], 'title': row['title'], 'problem_ids': _loads(row['problem_ids_json']), 'mode': row['mode'],
+        'show_problem_ids': bool(row['show_problem_ids']), 'created_by': row['created_by'], 'created_at': row['created_at']
     }
 
 
 def create_paper(title: str, problem_ids: List[str], mode: str, show_ids: bool):
     conn = get_conn()
-    c = conn.cursor()
-    c.execute('INSERT INTO papers(title, problem_ids_json, mode, show_problem_ids, created_by, created_at) VALUES(?,?,?,?,?,?)',
-              (title, json.dumps(problem_ids), mode, 1 if show_ids else 0, st.session_state.user['id'], datetime.datetime.utcnow().isoformat()))
-    conn.commit()
-    pid = c.lastrowid
-    conn.close()
+    with get_write_lock():
+        c = conn.cursor()
+        c.execute(SQL_INS_PAPER,
+                  (title, _dumps(problem_ids), mode, 1 if show_ids else 0, st.session_state.user['id']))
+        pid = c.lastrowid
+    get_paper.clear()
+    _get_problem_count_for_papers.clear()
     return pid
 
 
@@ -214,63 +393,79 @@ def create_paper(title: str, problem_ids: List[str], mode: str, show_ids: bool):
 # ---------------
 
 
-def record_submission(paper_id: int, pupil_id: int, answers: Dict[str, Any], score: float, attempt_no: int):
+def answers_to_json(answers: Dict[str, Any]) -> str:
+    """Serialize a submission's answers once, leaving out unanswered problems."""
+    return _dumps({pid: a for pid, a in answers.items() if not _is_blank_answer(a)})
+
+
+def _is_blank_answer(ans) -> bool:
+    if isinstance(ans, list):
+        return all(str(cell).strip() == '' for row in ans for cell in row)
+    return ans is None or str(ans).strip() == ''
+
+
+def record_submission(paper_id: int, pupil_id: int, answers_json: str, score: float, attempt_no: int):
     conn = get_conn()
-    c = conn.cursor()
-    c.execute('INSERT INTO submissions(paper_id, pupil_id, answers_json, score, attempt_no, submitted_at) VALUES(?,?,?,?,?,?)',
-              (paper_id, pupil_id, json.dumps(answers), score, attempt_no, datetime.datetime.utcnow().isoformat()))
-    conn.commit()
-    conn.close()
+    with get_write_lock():
+        c = conn.cursor()
+        c.execute(SQL_INS_SUBMISSION,
+                  (paper_id, pupil_id, answers_json, score, attempt_no))
+    get_teacher_logs.clear()
+    get_submission_count.clear()
 
 
 def get_attempt_count(paper_id: int, pupil_id: int) -> int:
     conn = get_conn()
     c = conn.cursor()
-    c.execute('SELECT COUNT(*) FROM submissions WHERE paper_id=? AND pupil_id=?', (paper_id, pupil_id))
+    c.execute(SQL_COUNT_ATTEMPTS, (paper_id, pupil_id))
     (cnt,) = c.fetchone()
-    conn.close()
     return cnt
 
 
-def get_teacher_logs():
+@st.cache_data(ttl=5)
+def get_teacher_logs(offset: int = 0, limit: int = LOGS_PAGE_SIZE):
     conn = get_conn()
     c = conn.cursor()
-    c.execute('''SELECT s.id, s.paper_id, u.name, u.email, s.score, s.attempt_no, s.submitted_at
-                 FROM submissions s JOIN users u ON s.pupil_id = u.id
-                 ORDER BY s.submitted_at DESC LIMIT 200''')
-    rows = c.fetchall()
-    conn.close()
-    return rows
+    c.execute(SQL_TEACHER_LOGS, (limit, offset))
+    return [dict(r) for r in c.fetchall()]
+
+
+@st.cache_data(ttl=5)
+def get_submission_count() -> int:
+    conn = get_conn()
+    c = conn.cursor()
+    c.execute(SQL_COUNT_SUBMISSIONS)
+    (cnt,) = c.fetchone()
+    return cnt
 
 def get_pupil_attempts(pupil_id: int):
-    """Returns list of (submitted_at, paper_id, paper_title, mode, score, attempt_no)."""
+    """Returns list of dicts with submitted_at, paper_id, title, mode, score, attempt_no."""
     conn = get_conn()
     c = conn.cursor()
-    c.execute('''SELECT s.submitted_at, p.id, p.title, p.mode, s.score, s.attempt_no
-                 FROM submissions s JOIN papers p ON s.paper_id = p.id
-                 WHERE s.pupil_id = ?
-                 ORDER BY s.submitted_at DESC''', (pupil_id,))
-    rows = c.fetchall()
-    conn.close()
-    return rows
+    c.execute(SQL_PUPIL_ATTEMPTS, (pupil_id,))
+    return [dict(r) for r in c.fetchall()]
 
 def get_problem_count_for_papers(paper_ids: List[int]) -> Dict[int, int]:
     if not paper_ids:
         return {}
+    # Hashable, order-independent cache key
+    return _get_problem_count_for_papers(tuple(sorted(set(paper_ids))))
+
+
+@st.cache_data(ttl=60)
+def _get_problem_count_for_papers(paper_ids: tuple) -> Dict[int, int]:
     placeholders = ','.join(['?']*len(paper_ids))
     conn = get_conn()
     c = conn.cursor()
     c.execute(f'SELECT id, problem_ids_json FROM papers WHERE id IN ({placeholders})', tuple(paper_ids))
-    res = {row[0]: len(json.loads(row[1])) for row in c.fetchall()}
-    conn.close()
+    res = {row['id']: len(_loads(row['problem_ids_json'])) for row in c.fetchall()}
     return res
 
 def get_attempt_counts_by_paper(pupil_id: int) -> Dict[int, int]:
     conn = get_conn()
     c = conn.cursor()
-    c.execute('SELECT paper_id, COUNT(*) FROM submissions WHERE pupil_id = ? GROUP BY paper_id', (pupil_id,))
-    d = {row[0]: row[1] for row in c.fetchall()}
-    conn.close()
+    c.execute(SQL_ATTEMPTS_BY_PAPER, (pupil_id,))
+    d = {row['paper_id']: row['n'] for row in c.fetchall()}
     return d
 
 def attempts_remaining(mode: str, attempts_so_far: int) -> Optional[int]:
@@ -290,8 +485,17 @@ def normalize_scalar(x: str) -> str:
     return (x or "").strip().lower()
 
 
+def _normalize_answer(answer_type: str, answer):
+    """Canonical form of a correct answer, stored once as answer_key_json."""
+    if answer_type == 'single':
+        return normalize_scalar(str(answer))
+    return [[normalize_scalar(str(cell)) for cell in row] for row in answer]
+
+
+# correct_ans / correct_tab are expected as the stored answer key (_normalize_answer form)
+
 def check_single(user_ans: str, correct_ans: str) -> bool:
-    return normalize_scalar(user_ans) == normalize_scalar(correct_ans)
+    return normalize_scalar(user_ans) == correct_ans
 
 
 def check_table(user_tab: List[List[str]], correct_tab: List[List[str]]) -> bool:
@@ -301,26 +505,29 @@ def check_table(user_tab: List[List[str]], correct_tab: List[List[str]]) -> bool
         if len(user_tab[r]) != len(correct_tab[r]):
             return False
         for c in range(len(correct_tab[r])):
-            if normalize_scalar(str(user_tab[r][c])) != normalize_scalar(str(correct_tab[r][c])):
+            if normalize_scalar(str(user_tab[r][c])) != correct_tab[r][c]:
                 return False
     return True
 
 
-def auto_score(problem_ids: List[str], user_answers: Dict[str, Any]) -> (float, Dict[str, bool]):
-    results = {}
-    correct_count = 0
-    for pid in problem_ids:
-        prob = get_problem(pid)
-        if not prob:
-            results[pid] = False
-            continue
-        if prob['answer_type'] == 'single':
-            ok = check_single(str(user_answers.get(pid, "")), str(prob['answer']))
-        else:
-            ok = check_table(user_answers.get(pid, []), prob['answer'])
-        results[pid] = ok
-        if ok:
-            correct_count += 1
+def _check_one(prob: Optional[Dict[str, Any]], user_ans) -> bool:
+    if not prob:
+        return False
+    if prob['answer_type'] == 'single':
+        return check_single(str(user_ans or ""), prob['answer_key'])
+    return check_table(user_ans or [], prob['answer_key'])
+
+
+def auto_score(problem_ids: List[str], user_answers: Dict[str, Any], problem_map: Dict[str, Dict[str, Any]]) -> (float, Dict[str, bool]):
+    """Score answers against problem_map as returned by get_problems (no DB access)."""
+    if problem_ids and all(pid in problem_map and problem_map[pid]['answer_type'] == 'single' for pid in problem_ids):
+        # All single answers (the common case): answer keys are pre-normalized,
+        # so one dict lookup per problem with no answer-type branching
+        results = {pid: normalize_scalar(str(user_answers.get(pid) or "")) == problem_map[pid]['answer_key']
+                   for pid in problem_ids}
+    else:
+        results = {pid: _check_one(problem_map.get(pid), user_answers.get(pid)) for pid in problem_ids}
+    correct_count = sum(results[pid] for pid in problem_ids)
     pct = 100.0 * correct_count / max(1, len(problem_ids))
     return pct, results
 
@@ -336,15 +543,42 @@ def editor_for_problem(existing=None):
     if answer_type == 'single':
         ans = st.text_input("Correct answer (alphanumeric)", value=(existing['answer'] if existing else ''))
     else:
-        st.caption("Enter table as rows separated by newlines, cells by commas. Example: \nA,B\nC,D")
+        st.caption("Enter table as rows separated by newlines, cells by spaces. Example: \nA B\nC D")
         table_text = ''
         if existing and isinstance(existing['answer'], list):
             table_text = "\n".join([" ".join(map(str,row)) for row in existing['answer']])
         table_text = st.text_area("Correct answer table", value=table_text, height=120)
-        ans = [ [cell.strip() for cell in line.split(' ')] for line in table_text.splitlines() if line.strip() != '' ]
+        ans = parse_table_text(table_text)
     return content, answer_type, ans
 
 
+def parse_table_text(table_text: str) -> List[List[str]]:
+    return [ [cell.strip() for cell in line.split(' ')] for line in table_text.splitlines() if line.strip() != '' ]
+
+
+def parse_problems_csv(data: bytes) -> (List[Tuple[str, str, str, Any]], List[int]):
+    """Parse an uploaded CSV with columns id, content, answer_type, answer.
+
+    Table answers use the editor's text format (rows by newline, cells by space).
+    Returns (rows, skipped line numbers); raises ValueError if columns are missing.
+    """
+    rows, skipped = [], []
+    reader = csv.DictReader(io.StringIO(data.decode('utf-8-sig')))
+    missing = [col for col in IMPORT_COLUMNS if col not in (reader.fieldnames or [])]
+    if missing:
+        raise ValueError(f"missing column(s): {', '.join(missing)}")
+    for rec in reader:
+        pid = (rec.get('id') or '').strip()
+        answer_type = (rec.get('answer_type') or '').strip().lower()
+        raw = rec.get('answer') or ''
+        if not pid or answer_type not in ('single', 'table') or not raw.strip():
+            skipped.append(reader.line_num)
+            continue
+        ans = raw.strip() if answer_type == 'single' else parse_table_text(raw)
+        rows.append((pid, rec.get('content') or '', answer_type, ans))
+    return rows, skipped
+
+
 def render_problem(prob: Dict[str, Any], show_id: bool):
     if show_id:
         st.caption(f"Problem ID: {prob['id']}")
@@ -357,13 +591,20 @@ def input_for_answer(prob: Dict[str, Any], key_prefix: str):
     else:
         rows = st.number_input("Rows", min_value=1, max_value=20, value=len(prob['answer']) if isinstance(prob['answer'], list) else 2, key=f"{key_prefix}_rows")
         cols = st.number_input("Cols", min_value=1, max_value=20, value=len(prob['answer'][0]) if isinstance(prob['answer'], list) and prob['answer'] else 2, key=f"{key_prefix}_cols")
-        grid = []
-        for r in range(int(rows)):
-            row_vals = []
-            cols_container = st.columns(int(cols))
-            for c in range(int(cols)):
-                row_vals.append(cols_container[c].text_input("", key=f"{key_prefix}_r{r}c{c}"))
-            grid.append(row_vals)
+        # One data_editor for the whole grid; rows/cols only set its starting shape.
+        # The editor resets whenever its data changes, so the starting grid is rebuilt
+        # only on resize, seeded from the pupil's last cells to keep what was typed.
+        rows, cols = int(rows), int(cols)
+        base_key, cells_key = f"{key_prefix}_grid_base", f"{key_prefix}_grid_cells"
+        base = st.session_state.get(base_key)
+        if base is None or base['shape'] != (rows, cols):
+            prev = st.session_state.get(cells_key, [])
+            cells = [[prev[r][c] if r < len(prev) and c < len(prev[r]) else '' for c in range(cols)] for r in range(rows)]
+            base = st.session_state[base_key] = {'shape': (rows, cols), 'cells': cells}
+        df = pd.DataFrame(base['cells'], columns=[str(c + 1) for c in range(cols)])
+        edited = st.data_editor(df, num_rows='dynamic', hide_index=True, key=f"{key_prefix}_grid")
+        grid = [['' if v is None else str(v) for v in row] for row in edited.values.tolist()]
+        st.session_state[cells_key] = grid
         return grid
 
 
@@ -398,32 +639,28 @@ def page_home():
         if not attempts:
             st.info("No attempts yet.")
         else:
-            paper_ids = [row[1] for row in attempts]
+            paper_ids = [row['paper_id'] for row in attempts]
             counts = get_attempt_counts_by_paper(user['id'])
             sizes = get_problem_count_for_papers(paper_ids)
-            # Table header
-            h = st.columns([3,2,3,2,2,2])
-            h[0].markdown("**Date/Time (UTC)**")
-            h[1].markdown("**Paper ID**")
-            h[2].markdown("**Title**")
-            h[3].markdown("**Score**")
-            h[4].markdown("**Attempts left**")
-            h[5].markdown("**Action**")
-            for i, (submitted_at, paper_id, title, mode, score, attempt_no) in enumerate(attempts):
-                y = sizes.get(paper_id, 0)
-                x = round((score/100.0) * y) if y else 0
-                rem = attempts_remaining(mode, counts.get(paper_id, 0))
-                rem_str = '∞' if rem is None else str(rem)
-                cols = st.columns([3,2,3,2,2,2])
-                cols[0].write(submitted_at)
-                cols[1].write(f"{paper_id}")
-                cols[2].write(title)
-                cols[3].write(f"{x} / {y} ({score:.0f}%)")
-                cols[4].write(rem_str)
-                if cols[5].button("Open", key=f"open_attempt_{i}"):
-                    st.session_state.paper_id_input = str(paper_id)
-                    set_page("Pupil: Paper")
-                    st.rerun()
+            scores = [row['score'] for row in attempts]
+            ys = [sizes.get(pid, 0) for pid in paper_ids]
+            xs = [round((score/100.0) * y) if y else 0 for score, y in zip(scores, ys)]
+            rems = [attempts_remaining(row['mode'], counts.get(row['paper_id'], 0)) for row in attempts]
+            df = pd.DataFrame({
+                'Date/Time (UTC)': [row['submitted_at'] for row in attempts],
+                'Paper ID': paper_ids,
+                'Title': [row['title'] for row in attempts],
+                'Score': [f"{x} / {y} ({score:.0f}%)" for x, y, score in zip(xs, ys, scores)],
+                'Attempts left': ['∞' if rem is None else str(rem) for rem in rems],
+            })
+            st.caption("Select a row to open that paper.")
+            # One dataframe widget instead of a row of columns + button per attempt
+            event = st.dataframe(df, use_container_width=True, hide_index=True,
+                                 on_select='rerun', selection_mode='single-row', key="past_attempts")
+            if event.selection.rows:
+                st.session_state.paper_id_input = str(paper_ids[event.selection.rows[0]])
+                set_page("Pupil: Paper")
+                st.rerun()
     else:
         st.subheader("Welcome, Teacher")
         st.write("Use the sidebar to manage Problems and Papers.")
@@ -463,9 +700,21 @@ def page_teacher_problems():
             st.info("Enter a valid Problem ID to preview.")
 
     st.divider()
-    st.subheader("Mass Import (placeholder)")
-    st.file_uploader("Upload CSV/XLSX of problems (placeholder – not parsed yet)")
-    st.caption("This is a placeholder. File is not processed yet.")
+    st.subheader("Mass Import")
+    upload = st.file_uploader("Upload CSV of problems", type=["csv"])
+    st.caption("Header row: id, content, answer_type (single/table), answer. Existing IDs are overwritten. "
+               "For table answers, quote the answer cell and put each row on its own line with cells separated by spaces, "
+               "e.g. \"A B\nC D\". Rows with an empty answer are skipped.")
+    if upload is not None and st.button("Import Problems"):
+        try:
+            rows, skipped = parse_problems_csv(upload.getvalue())
+        except (UnicodeDecodeError, csv.Error, ValueError) as e:
+            st.error(f"Could not read CSV: {e}")
+        else:
+            n = save_problems_bulk(rows)
+            st.success(f"Imported {n} problem(s).")
+            if skipped:
+                st.warning(f"Skipped invalid rows on lines: {', '.join(map(str, skipped))}")
 
 
 def page_teacher_papers():
@@ -490,24 +739,40 @@ def page_teacher_papers():
             st.success(f"Paper created with ID {pid}")
 
     st.divider()
-    st.subheader("Teacher Logs (latest 200)")
-    rows = get_teacher_logs()
-    if not rows:
+    st.subheader("Teacher Logs")
+    total = get_submission_count()
+    if not total:
         st.info("No submissions yet.")
     else:
+        n_pages = (total + LOGS_PAGE_SIZE - 1) // LOGS_PAGE_SIZE
+        st.caption(f"{total} submissions, newest first, {n_pages} page(s)")
+        page = st.number_input("Page", min_value=1, max_value=n_pages, value=1, key="logs_page")
+        rows = get_teacher_logs(offset=(int(page) - 1) * LOGS_PAGE_SIZE, limit=LOGS_PAGE_SIZE)
         st.dataframe([
             {
-                'Submission ID': r[0],
-                'Paper ID': r[1],
-                'Pupil': r[2],
-                'Email': r[3],
-                'Score %': r[4],
-                'Attempt': r[5],
-                'Submitted at (UTC)': r[6]
+                'Submission ID': r['id'],
+                'Paper ID': r['paper_id'],
+                'Pupil': r['name'],
+                'Email': r['email'],
+                'Score %': r['score'],
+                'Attempt': r['attempt_no'],
+                'Submitted at (UTC)': r['submitted_at']
             } for r in rows
         ], use_container_width=True)
 
 
+def answer_state_key(paper_id: int, problem_id: str) -> str:
+    return f"ans_{paper_id}_{problem_id}"
+
+
+@st.fragment
+def _problem_block(p: Dict[str, Any], paper_id: int, show_id: bool):
+    # Fragment: typing into this problem's inputs reruns only this block
+    with st.expander(f"Problem {p['id']}" if show_id else "Problem"):
+        render_problem(p, show_id=show_id)
+        st.session_state[answer_state_key(paper_id, p['id'])] = input_for_answer(p, key_prefix=f"paper_{paper_id}_{p['id']}")
+
+
 def page_pupil_paper():
     user = require_auth("pupil")
     if not user: return
@@ -530,27 +795,27 @@ def page_pupil_paper():
     st.subheader(paper['title'])
     st.caption(f"Mode: {paper['mode']}")
 
-    problems = [get_problem(x) for x in paper['problem_ids']]
+    problem_map = get_problems(paper['problem_ids'])
+    problems = [problem_map.get(x) for x in paper['problem_ids']]
     missing = [paper['problem_ids'][i] for i,p in enumerate(problems) if p is None]
     if missing:
         st.warning(f"Missing problems: {', '.join(missing)}")
 
-    answers = {}
     for p in problems:
         if not p:
             continue
-        with st.expander(f"Problem {p['id']}" if paper['show_problem_ids'] else "Problem"):
-            render_problem(p, show_id=paper['show_problem_ids'])
-            answers[p['id']] = input_for_answer(p, key_prefix=f"paper_{paper_id}_{p['id']}")
-
-    # Attempt control for test modes
-    attempts_so_far = get_attempt_count(paper_id, user['id'])
+        _problem_block(p, paper_id, paper['show_problem_ids'])
 
     # Submit button
     submitted = st.button("Submit Paper")
     if not submitted:
         return
 
+    answers = {p['id']: st.session_state.get(answer_state_key(paper_id, p['id'])) for p in problems if p}
+
+    # Attempt control for test modes (only needed once the pupil submits)
+    attempts_so_far = get_attempt_count(paper_id, user['id'])
+
     # Enforce mode rules
     if paper['mode'] == 'test1' and attempts_so_far >= 1:
         st.error("Test mode-1 allows only one attempt.")
@@ -559,9 +824,9 @@ def page_pupil_paper():
         st.error("Test mode-2 allows only two attempts.")
         return
 
-    pct, per_problem = auto_score([p['id'] for p in problems if p], answers)
+    pct, per_problem = auto_score([p['id'] for p in problems if p], answers, problem_map)
     attempt_no = attempts_so_far + 1
-    record_submission(paper_id, user['id'], answers, pct, attempt_no)
+    record_submission(paper_id, user['id'], answers_to_json(answers), pct, attempt_no)
 
     st.subheader(f"Your Score: {pct:.1f}%")
 
@@ -605,10 +870,17 @@ def page_pupil_paper():
 # App bootstrap
 # ---------------
 
-def main():
-    st.set_page_config(page_title="Problem DB", page_icon="🧮", layout="wide")
+@st.cache_resource
+def _bootstrap():
+    # Schema + demo users once per process, not on every rerun
     init_db()
     ensure_demo_users()
+    return True
+
+
+def main():
+    st.set_page_config(page_title="Problem DB", page_icon="🧮", layout="wide")
+    _bootstrap()
 
     if 'user' not in st.session_state:
         st.session_state.user = None
@@ -664,7 +936,9 @@ if __name__ == '__main__':
 # ==========================
 # File: requirements.txt (put next to app.py)
 # ==========================
-# streamlit and nothing else is strictly required; sqlite3 is in stdlib
+# streamlit, pandas and orjson are required; sqlite3 is in stdlib
 # If you deploy on Streamlit Community Cloud, include this file.
 # ---
-# streamlit>=1.33
+# streamlit>=1.37
+# pandas>=2.0
+# orjson>=3.9